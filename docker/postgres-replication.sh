@@ -0,0 +1,6 @@
+#!/bin/sh
+# Runs once on the primary's first start: lets db-replica stream WAL from it
+set -e
+
+psql -v ON_ERROR_STOP=1 --username "$POSTGRES_USER" -c "CREATE ROLE replicator WITH REPLICATION LOGIN PASSWORD '$POSTGRES_PASSWORD'"
+echo "host replication replicator all scram-sha-256" >> "$PGDATA/pg_hba.conf"
@@ -1,25 +1,32 @@
 import os
 import sys
+import tempfile
+from datetime import timedelta
 import telebot
 from telebot import types
 
 from src.models import ClientModel, PsychologistModel, AdminModel, DatabaseConnector
 from src.conversation_handler import ConversationHandler
 from src.psychologist_matcher import PsychologistMatcher
+from src.match_worker import MatchWorker
 from src.dump_clients import dump_db
+from src.import_psychologists import load_roster
+from src.conversation import FormatError
+from src.update_trace import UpdateRecorder
 
+ADMINS = ["zhantaram", "Assem_Kamitova", "uramaz"]
+PSYCHOLOGISTS = ["Aselpsyholog", "buharJerreau", "Zhanara6142", "Zhamilya_Kh", "Love_of_fate", "Assem_Kamitova"]
 
-def main():
-    print("Bot started", file=sys.stderr)
-    db_connector = DatabaseConnector(os.getenv("DB_RECIPE"))
-    bot = telebot.TeleBot(os.getenv("BOT_TOKEN"), threaded=False)
 
-    admins = set(["zhantaram", "Assem_Kamitova", "uramaz"])
-    psychologists = set(["Aselpsyholog", "buharJerreau", "Zhanara6142", "Zhamilya_Kh", "Love_of_fate", "Assem_Kamitova"])
+def setup_bot(bot: telebot.TeleBot, db_connector: DatabaseConnector, admins: set[str], psychologists: set[str]) -> MatchWorker:
+    # Registers all handlers on bot. Returned worker has to be started to process matches
+    psychologists |= db_connector.get_roster_usernames()
 
-    psychologists_map = list(filter(lambda ps: ps.username in psychologists, db_connector.list_psychologists()))
+    def load_psychologists_map() -> list[PsychologistModel]:
+        return list(filter(lambda ps: ps.username in psychologists and ps.chat_id is not None, db_connector.list_psychologists(primary=True)))
 
-    ps_matcher = PsychologistMatcher(bot, db_connector, psychologists_map)
+    ps_matcher = PsychologistMatcher(bot, db_connector, load_psychologists_map())
+    match_worker = MatchWorker(db_connector, ps_matcher, threads_count=int(os.getenv("MATCH_WORKERS", "2")))
 
     conversation_handler = ConversationHandler(bot, admins, psychologists)
 
@@ -43,6 +50,32 @@ def main():
 
     conversation_handler.add_admin_handle("/dump", dump_data_handle)
 
+    def import_psychologists_handle(message: types.Message):
+        # /import as a caption of xlsx or csv file
+        db_connector.merge_row(AdminModel(admin_chat_id=message.chat.id))
+        file_name: str = (message.document.file_name or "").lower()  # Windows often sends ROSTER.XLSX
+        if not file_name.endswith((".xlsx", ".csv")):
+            bot.send_message(message.chat.id, "Нужен файл .xlsx или .csv")
+            return
+
+        content: bytes = bot.download_file(bot.get_file(message.document.file_id).file_path)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path_to_file = os.path.join(tmp_dir, "roster" + os.path.splitext(file_name)[1])
+            with open(path_to_file, 'wb') as out:
+                out.write(content)
+            try:
+                roster = load_roster(path_to_file)
+            except FormatError as e:
+                bot.send_message(message.chat.id, str(e))
+                return
+
+        db_connector.upsert_psychologists(roster)
+        psychologists.update(ps["username"] for ps in roster)
+        ps_matcher.set_roster(load_psychologists_map())
+        bot.send_message(message.chat.id, f"Загружено психологов: {len(roster)}")
+
+    conversation_handler.add_admin_document_handle("/import", import_psychologists_handle)
+
     """
     def psychologist_conversation_callback(chat: types.Chat, ps_answers: dict):
         psychologist = PsychologistModel.create_pyschologist_from_answers(chat.id, chat.username, ps_answers)
@@ -58,8 +91,8 @@ def main():
 
     def client_conversation_callback(chat: types.Chat, client_answers: dict):
         client = ClientModel.create_client_from_answers(chat.id, client_answers)
-        db_connector.merge_row(client)
-        ps_matcher.match_client(client)
+        db_connector.enqueue_match(client)
+        match_worker.notify()
 
     conversation_handler.add_conversation(
         ClientModel.create_client_conversation(),
@@ -67,6 +100,35 @@ def main():
         lambda message: message.from_user.username not in admins and message.from_user.username not in psychologists and db_connector.lookup_client(message.chat.id) is None,
     )
 
+    return match_worker
+
+
+def main():
+    print("Bot started", file=sys.stderr)
+    db_connector = DatabaseConnector(
+        os.getenv("DB_RECIPE"),
+        os.getenv("DB_REPLICA_RECIPE"),
+        timedelta(seconds=float(os.getenv("DB_REPLICA_MAX_LAG", "5"))),
+    )
+    bot = telebot.TeleBot(os.getenv("BOT_TOKEN"), threaded=False)
+
+    admins = set(ADMINS)
+    psychologists = set(PSYCHOLOGISTS)
+
+    match_worker = setup_bot(bot, db_connector, admins, psychologists)
+
+    if os.getenv("TRACE_PATH"):
+        # Anonymized log of incoming updates, can be fed to replay.py. Checks the live sets, which setup_bot
+        # filled with the database roster and /import keeps updating
+        salt = os.getenv("TRACE_SALT")
+        recorder = UpdateRecorder(
+            os.getenv("TRACE_PATH"),
+            lambda username: username in admins or username in psychologists,
+            salt.encode("utf8") if salt else None,
+        )
+        recorder.install(bot)
+
+    match_worker.start()
     bot.infinity_polling()
 
 
@@ -0,0 +1,196 @@
+import argparse
+import itertools
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from typing import Optional
+import telebot
+from telebot import apihelper, types
+
+from main import ADMINS, PSYCHOLOGISTS, setup_bot
+from src.models import DatabaseConnector
+from src.import_psychologists import load_roster
+from src.update_trace import read_trace
+
+SYNTHETIC_CHAT_ID_BASE = 10 ** 12  # for roster rows without chat_id, the fake Bot API accepts any id
+
+
+class FakeResponse:
+    __slots__ = [
+        "_result",
+        "status_code",
+    ]
+
+    def __init__(self, result):
+        self._result = result
+        self.status_code = 200
+
+    @property
+    def text(self) -> str:
+        return json.dumps(self.json())
+
+    def json(self) -> dict:
+        return {"ok": True, "result": self._result}
+
+
+class FakeBotApi:
+    # Answers Bot API requests locally instead of api.telegram.org, optionally with a network delay.
+    # Requests are counted separately for update handlers and match workers
+    __slots__ = [
+        "_latency",
+        "_message_ids",
+        "_lock",
+        "handler_requests",
+        "matching_requests",
+    ]
+
+    def __init__(self, latency_ms: float):
+        self._latency: float = latency_ms / 1000
+        self._message_ids = itertools.count(1)
+        self._lock: threading.Lock = threading.Lock()
+        self.handler_requests: int = 0
+        self.matching_requests: int = 0
+
+    def install(self):
+        apihelper.CUSTOM_REQUEST_SENDER = self.request
+
+    def request(self, method: str, url: str, params=None, files=None, **kwargs) -> FakeResponse:
+        if self._latency:
+            time.sleep(self._latency)
+        params = params or {}
+        method_name = url.rsplit("/", 1)[-1]
+        with self._lock:
+            if threading.current_thread().name.startswith("MatchWorker"):
+                self.matching_requests += 1
+            else:
+                self.handler_requests += 1
+            message_id = next(self._message_ids)
+
+        if method_name == "getMe":
+            return FakeResponse({"id": 1, "is_bot": True, "first_name": "replay", "username": "replay_bot"})
+        if method_name.startswith("send") or method_name.startswith("edit"):
+            return FakeResponse({
+                "message_id": int(params.get("message_id", message_id)),
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+                "text": params.get("text", ""),
+            })
+        return FakeResponse(True)
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def print_latency(name: str, values: list[float]):
+    mean = statistics.mean(values) if values else 0.0
+    print(f"{name:>9} ms: mean {mean:.2f}, p50 {percentile(values, 50):.2f}, p90 {percentile(values, 90):.2f}, "
+          f"p99 {percentile(values, 99):.2f}, max {max(values, default=0.0):.2f}")
+
+
+def seed_roster(db_connector: DatabaseConnector, roster_path: str):
+    roster = load_roster(roster_path)
+    for idx, psychologist in enumerate(roster):
+        if psychologist.get("chat_id") is None:
+            psychologist["chat_id"] = SYNTHETIC_CHAT_ID_BASE + idx
+    db_connector.upsert_psychologists(roster)
+
+
+def wait_for_match_jobs(db_connector: DatabaseConnector, timeout: float) -> bool:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if db_connector.count_unfinished_match_jobs() == 0:
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def replay(trace_path: str, db_recipe: Optional[str], roster_path: Optional[str], speed: float, api_latency_ms: float, drain_timeout: float):
+    # speed: 1 - as recorded, N - N times faster, 0 - as fast as possible
+    fake_api = FakeBotApi(api_latency_ms)
+    fake_api.install()
+
+    tmp_dir = None
+    if db_recipe is None:
+        tmp_dir = tempfile.TemporaryDirectory()
+        db_recipe = "sqlite:///" + os.path.join(tmp_dir.name, "replay.db")
+    db_connector = DatabaseConnector(db_recipe)
+    if roster_path is not None:
+        seed_roster(db_connector, roster_path)
+    last_job_before = db_connector.get_last_match_job_id()
+
+    bot = telebot.TeleBot("0:replay", threaded=False)
+    setup_bot(bot, db_connector, set(ADMINS), set(PSYCHOLOGISTS)).start()
+
+    service_ms: list[float] = []  # time spent in handlers
+    response_ms: list[float] = []  # handling time plus time the update waited behind previous ones
+    recorded_ms: list[float] = []
+    errors = 0
+
+    first_ts = None
+    start = time.perf_counter()
+    for record in read_trace(trace_path):
+        if first_ts is None:
+            first_ts = record["ts"]
+        scheduled = start + (record["ts"] - first_ts) / speed if speed > 0 else time.perf_counter()
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+        update = types.Update.de_json(record["update"])
+        handling_start = time.perf_counter()
+        try:
+            bot.process_new_updates([update])
+        except Exception as e:
+            errors += 1
+            print(f"Update {update.update_id} failed: {e!r}", file=sys.stderr)
+        finished = time.perf_counter()
+
+        service_ms.append((finished - handling_start) * 1000)
+        response_ms.append((finished - scheduled) * 1000)
+        recorded_ms.append(record["ms"])
+
+    handlers_elapsed = time.perf_counter() - start
+    drained = wait_for_match_jobs(db_connector, drain_timeout)
+    elapsed = time.perf_counter() - start
+
+    jobs = db_connector.list_match_jobs(after_id=last_job_before)
+    job_statuses = {status: sum(job.status == status for job in jobs) for status in ("done", "failed", "pending", "running")}
+    job_ms = [(job.finished_at - job.created_at).total_seconds() * 1000 for job in jobs if job.status == "done"]
+
+    print(f"Updates: {len(service_ms)}, errors: {errors}, Bot API requests: {fake_api.handler_requests}")
+    print(f"Handlers elapsed: {handlers_elapsed:.2f}s, throughput: {len(service_ms) / handlers_elapsed if handlers_elapsed else 0:.1f} updates/s")
+    print_latency("handling", service_ms)
+    print_latency("response", response_ms)
+    print_latency("recorded", recorded_ms)
+
+    print(f"Match jobs: {', '.join(f'{status} {count}' for status, count in job_statuses.items())}, "
+          f"Bot API requests: {fake_api.matching_requests}" + ("" if drained else f" (not drained in {drain_timeout:.0f}s)"))
+    print(f"Total elapsed: {elapsed:.2f}s")
+    print_latency("match job", job_ms)
+
+    if tmp_dir is not None:
+        tmp_dir.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a trace recorded with TRACE_PATH against a fake Bot API")
+    parser.add_argument("trace", help="path to the recorded trace")
+    parser.add_argument("--db", help="database recipe, e.g. a copy of the production database. Temporary SQLite file by default")
+    parser.add_argument("--roster", help="xlsx or csv roster as for /import (optionally with chat_id) to seed psychologists")
+    parser.add_argument("--speed", type=float, default=1.0, help="1 - real time, N - N times faster, 0 - as fast as possible")
+    parser.add_argument("--api-latency-ms", type=float, default=0.0, help="simulated Bot API round trip")
+    parser.add_argument("--drain-timeout", type=float, default=300.0, help="how long to wait for queued matches after the trace ends")
+    args = parser.parse_args()
+    replay(args.trace, args.db, args.roster, args.speed, args.api_latency_ms, args.drain_timeout)
+
+
+if __name__ == "__main__":
+    main()
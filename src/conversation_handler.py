@@ -42,13 +42,20 @@ class ConversationHandler:
             return message.from_user.username in self._admins and message.text.startswith(command)
         self._bot.register_message_handler(callback, func=admin_filter)
 
+    def add_admin_document_handle(self, command: str, callback: Callable[[types.Message], None]):
+        # Admin sends a file with the command as its caption
+        def admin_filter(message: types.Message) -> bool:
+            return message.from_user.username in self._admins and (message.caption or "").startswith(command)
+        self._bot.register_message_handler(callback, content_types=["document"], func=admin_filter)
+
     def add_conversation(self, conversation: Conversation, callback: Callable[[int, dict], None], path_filter: Callable[[types.Message], bool]):
         self._conversation_pool.append(ConversationSelector(conversation, callback, path_filter))
 
     def _start_conversation(self, message: types.Message):
         assert len(self._conversation_pool) == 1
         if message.from_user.username in self._admins:
-            self._bot.send_message(message.chat.id, "Вы администратор. Вы можете вводить две команды:\n/dump - скачать базу в Excel\n/add {имя пользователя}")
+            self._bot.send_message(message.chat.id, "Вы администратор. Вы можете вводить три команды:\n/dump - скачать базу в Excel\n/add {имя пользователя}\n"
+                                                   "/import - загрузить список психологов (отправьте .xlsx или .csv файл с этой командой в подписи)")
             return
 
         maybe_conv_idx: Optional[int] = self._select_conversation_idx(message)
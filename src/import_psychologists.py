@@ -0,0 +1,119 @@
+import csv
+import io
+import re
+import zipfile
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+
+from .conversation import FormatError
+from .dialogue_texts import PROBLEM_TYPES_STR
+
+# Roster columns: username, languages, client_sex, problem_types. Optional name and chat_id columns
+# languages: ru, kz or both (ru kz / rukz); client_sex: boy, girl or both (boy girl / boygirl)
+# problem_types: problem numbers as in the psychologist questionnaire, e.g. "1 4 9 11"
+COLUMNS = {
+    "username": "username",
+    "name": "name",
+    "chat_id": "chat_id",
+    "languages": "client_lang",
+    "lang": "client_lang",
+    "client_lang": "client_lang",
+    "client_sex": "client_sex",
+    "sex": "client_sex",
+    "problem_types": "problem_type",
+    "problem_type": "problem_type",
+}
+REQUIRED_FIELDS = ["username", "client_lang", "client_sex", "problem_type"]
+
+
+def _split(value: str) -> list[str]:
+    return [item for item in re.split(r"[\s,;]+", value.strip().lower()) if item]
+
+
+def _parse_options(value: str, options: list[str], row_idx: int, field: str) -> str:
+    chosen = set(_split(value))
+    if "both" in chosen or "".join(options) in chosen:
+        chosen = set(options)
+    if not chosen or not chosen.issubset(options):
+        raise FormatError(f"Строка {row_idx}: неверное значение {field}: {value}")
+    return "".join(option for option in options if option in chosen)
+
+
+def _parse_problem_types(value: str, row_idx: int) -> str:
+    try:
+        chosen = set(int(item) - 1 for item in _split(value))
+    except ValueError:
+        raise FormatError(f"Строка {row_idx}: номера проблем должны быть числами: {value}")
+    if not chosen or not all(0 <= pr_type < len(PROBLEM_TYPES_STR) for pr_type in chosen):
+        raise FormatError(f"Строка {row_idx}: неверные номера проблем: {value}")
+    return " ".join(str(pr_type) for pr_type in sorted(chosen))
+
+
+def _parse_chat_id(value: str, row_idx: int) -> int:
+    try:
+        return int(value[:-2]) if value.endswith(".0") else int(value)  # xlsx stores numbers as floats
+    except ValueError:
+        raise FormatError(f"Строка {row_idx}: chat_id должен быть числом: {value}")
+
+
+def _read_csv(path: str) -> list[list[str]]:
+    # Excel saves csv in the system code page, cp1251 for Russian Windows, and separates columns with ";"
+    with open(path, "rb") as inp:
+        content = inp.read()
+    try:
+        text = content.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        text = content.decode("cp1251")
+
+    try:
+        dialect = csv.Sniffer().sniff(text.split("\n", 1)[0], delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    return [row for row in csv.reader(io.StringIO(text, newline=""), dialect)]
+
+
+def _read_rows(path: str) -> list[list[str]]:
+    try:
+        if path.lower().endswith(".csv"):
+            return _read_csv(path)
+
+        wb = load_workbook(path, read_only=True)
+        rows = [["" if cell is None else str(cell) for cell in row] for row in wb.active.iter_rows(values_only=True)]
+        wb.close()
+        return rows
+    except (csv.Error, UnicodeDecodeError, zipfile.BadZipFile, InvalidFileException, KeyError, ValueError, OSError):
+        raise FormatError("Не удалось прочитать файл. Сохраните его как .xlsx или .csv и отправьте снова")
+
+
+def load_roster(path: str) -> list[dict]:
+    # Returns rows ready for DatabaseConnector.upsert_psychologists
+    rows = _read_rows(path)
+    if not rows:
+        raise FormatError("Файл пустой")
+
+    header = [COLUMNS.get(column.strip().lower()) for column in rows[0]]
+    missing = [field for field in REQUIRED_FIELDS if field not in header]
+    if missing:
+        raise FormatError("В файле нет колонок: " + ", ".join(missing))
+    fields = [field for field in dict.fromkeys(header) if field is not None]
+
+    psychologists: dict[str, dict] = {}
+    for row_idx, row in enumerate(rows[1:], start=2):
+        values = {field: value.strip() for field, value in zip(header, row) if field is not None}
+        if not any(values.values()):
+            continue
+
+        username = values.get("username", "").lstrip("@")
+        if not username:
+            raise FormatError(f"Строка {row_idx}: не указан username")
+
+        psychologist = {field: values.get(field) or None for field in fields}
+        psychologist["username"] = username
+        psychologist["client_lang"] = _parse_options(values.get("client_lang", ""), ["ru", "kz"], row_idx, "languages")
+        psychologist["client_sex"] = _parse_options(values.get("client_sex", ""), ["boy", "girl"], row_idx, "client_sex")
+        psychologist["problem_type"] = _parse_problem_types(values.get("problem_type", ""), row_idx)
+        if psychologist.get("chat_id") is not None:
+            psychologist["chat_id"] = _parse_chat_id(psychologist["chat_id"], row_idx)
+        psychologists[username] = psychologist  # the last row wins for duplicated usernames
+
+    return list(psychologists.values())
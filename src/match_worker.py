@@ -0,0 +1,115 @@
+import sys
+import threading
+import traceback
+from datetime import datetime, timedelta
+from typing import Optional
+from telebot.apihelper import ApiTelegramException
+
+from . import models
+from .psychologist_matcher import PsychologistMatcher
+
+
+class MatchWorker:
+    # Offers clients to psychologists for jobs queued by DatabaseConnector.enqueue_match,
+    # so update handlers don't wait for the fan-out to psychologists
+    __slots__ = [
+        "_db_connector",
+        "_ps_matcher",
+        "_threads_count",
+        "_poll_interval",
+        "_max_attempts",
+        "_lock_timeout",
+        "_wakeup",
+        "_threads",
+    ]
+
+    def __init__(
+        self,
+        db_connector: models.DatabaseConnector,
+        ps_matcher: PsychologistMatcher,
+        threads_count: int = 2,
+        poll_interval: float = 5.0,
+        max_attempts: int = 5,
+        lock_timeout: timedelta = timedelta(minutes=5),
+    ):
+        self._db_connector: models.DatabaseConnector = db_connector
+        self._ps_matcher: PsychologistMatcher = ps_matcher
+        self._threads_count: int = threads_count
+        self._poll_interval: float = poll_interval
+        self._max_attempts: int = max_attempts
+        self._lock_timeout: timedelta = lock_timeout
+        self._wakeup: threading.Event = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+    def start(self):
+        for idx in range(self._threads_count):
+            thread = threading.Thread(target=self._run, name=f"MatchWorker-{idx}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def notify(self):
+        # Job was enqueued by this process, no need to wait for the next poll
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            # Cleared before claiming: notify() arriving after this point is either seen by the claim or wakes the wait
+            self._wakeup.clear()
+            try:
+                job: Optional[models.MatchJobModel] = self._db_connector.claim_match_job(self._lock_timeout)
+            except Exception:
+                traceback.print_exc(file=sys.stderr)
+                job = None
+
+            if job is None:
+                self._wakeup.wait(self._poll_interval)
+                continue
+
+            try:
+                self._process(job)
+            except Exception:
+                # Job stays "running" and is claimed again after lock_timeout
+                traceback.print_exc(file=sys.stderr)
+
+    def _process(self, job: models.MatchJobModel):
+        try:
+            client: Optional[models.ClientModel] = self._db_connector.lookup_client(job.client_chat_id)
+            if client is not None:
+                self._match(job, client)
+            self._db_connector.finish_match_job(job.id)
+        except Exception as e:
+            print(f"Match job {job.id} failed on attempt {job.attempts}: {e!r}", file=sys.stderr)
+            retry_at: Optional[datetime] = None
+            if job.attempts < self._max_attempts:
+                retry_at = datetime.now() + timedelta(seconds=2 ** job.attempts)
+            self._db_connector.fail_match_job(job.id, repr(e), retry_at)
+
+    def _match(self, job: models.MatchJobModel, client: models.ClientModel):
+        # Offers and the admin notification are recorded on the job, a retry continues where the failed attempt stopped.
+        # A psychologist the Bot API refuses for good (blocked the bot, chat not found) is skipped,
+        # a transient error fails the job for a retry only after everybody else got the offer
+        done: set[int] = set(int(ps_chat_id) for ps_chat_id in (job.offered_ps_chat_ids + " " + job.skipped_ps_chat_ids).split())
+        transient_error: Optional[Exception] = None
+        for psychologist in self._ps_matcher.find_psychologists(client):
+            if psychologist.chat_id in done:
+                continue
+            try:
+                assignment = self._ps_matcher.offer_client(client, psychologist)
+            except ApiTelegramException as e:
+                if 400 <= e.error_code < 500 and e.error_code != 429:
+                    print(f"Match job {job.id}: psychologist {psychologist.username} skipped: {e!r}", file=sys.stderr)
+                    self._db_connector.skip_match_offer(job.id, psychologist.chat_id, repr(e))
+                else:
+                    transient_error = e
+                continue
+            except Exception as e:
+                transient_error = e
+                continue
+            self._db_connector.save_match_offer(job.id, assignment)
+
+        if not job.admins_notified:
+            self._ps_matcher.notify_admins(client)
+            self._db_connector.mark_match_admins_notified(job.id)
+
+        if transient_error is not None:
+            raise transient_error
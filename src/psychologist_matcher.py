@@ -58,12 +58,22 @@ class PsychologistMatcher:
         self._bot.register_callback_query_handler(self._assigned_ps_callback, ClientAssignedPsCallback.callback_filter)
         self._bot.register_callback_query_handler(self._process_score, ClientReviewScoresCallback.callback_filter)
 
-    def match_client(self, client: models.ClientModel):
-        for psychologist in self._ps_map:
-            if client.lang in psychologist.client_lang and client.sex in psychologist.client_sex and client.pr_type in psychologist.problem_type.split():
-                message = self._bot.send_message(psychologist.chat_id, str(client), reply_markup=MatchPsychologistCallback.keyboard())
-                self._db_connector.merge_row(models.AssignmentsModel(client_chat_id=client.chat_id, ps_chat_id=psychologist.chat_id, message_id=message.id))
-
+    def set_roster(self, psychologists_map: list[models.PsychologistModel]):
+        # Replaced as a whole, match workers keep iterating the list they already took
+        self._ps_map = psychologists_map
+
+    def find_psychologists(self, client: models.ClientModel) -> list[models.PsychologistModel]:
+        return [
+            psychologist for psychologist in self._ps_map
+            if client.lang in psychologist.client_lang and client.sex in psychologist.client_sex and client.pr_type in psychologist.problem_type.split()
+        ]
+
+    def offer_client(self, client: models.ClientModel, psychologist: models.PsychologistModel) -> models.AssignmentsModel:
+        # Returned assignment is not saved yet
+        message = self._bot.send_message(psychologist.chat_id, str(client), reply_markup=MatchPsychologistCallback.keyboard())
+        return models.AssignmentsModel(client_chat_id=client.chat_id, ps_chat_id=psychologist.chat_id, message_id=message.id)
+
+    def notify_admins(self, client: models.ClientModel):
         for admin in self._db_connector.list_admins():
             if admin.admin_chat_id != 341946947:
                 continue
@@ -0,0 +1,142 @@
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+import telebot
+from telebot import apihelper, types
+from typing import Any, Callable, Iterator, Optional
+
+
+ID_KEYS = {"chat_id", "user_id", "sender_chat_id"}
+DROPPED_KEYS = {
+    "last_name", "phone_number", "contact", "location", "venue", "address", "bio", "photo", "file_name",
+    "forward_sender_name", "sender_user_name",
+}
+TEXT_KEYS = {"text", "caption"}
+FILE_ID_KEYS = {"file_id", "file_unique_id"}  # enough to download the file with the bot token
+MAX_KEPT_NUMBER_LENGTH = 3  # age answers, longer numbers may be phones or documents
+
+
+class UpdateAnonymizer:
+    # Replaces personal data in raw updates with stable pseudonyms so the trace keeps the conversation shape:
+    # the same user always gets the same fake id, commands, short numeric answers and button data are kept as is.
+    # File ids of every attachment are replaced too
+    __slots__ = [
+        "_salt",
+        "_is_staff_username",
+    ]
+
+    def __init__(self, salt: bytes, is_staff_username: Callable[[str], bool]):
+        self._salt: bytes = salt
+        # Staff accounts are kept as is, their usernames drive admin/psychologist routing.
+        # A callable, so psychologists imported while recording are recognized too
+        self._is_staff_username: Callable[[str], bool] = is_staff_username
+
+    def anonymize(self, update: dict) -> dict:
+        return self._anonymize_dict(update)
+
+    def _pseudonym(self, value: Any) -> str:
+        return hmac.new(self._salt, str(value).encode("utf8"), hashlib.sha256).hexdigest()
+
+    def _anonymize_id(self, value: int) -> int:
+        anon = int(self._pseudonym(value)[:12], 16)
+        return -anon if value < 0 else anon
+
+    @staticmethod
+    def _is_user_or_chat(obj: dict) -> bool:
+        # Wherever it is nested (from, chat, forward_origin.sender_user, via_bot, ...)
+        return "is_bot" in obj or ("type" in obj and "id" in obj)
+
+    def _is_staff(self, obj: dict) -> bool:
+        return isinstance(obj.get("username"), str) and self._is_staff_username(obj["username"])
+
+    def _anonymize_text(self, text: str) -> str:
+        if text.startswith("/") or (text.isdigit() and len(text) <= MAX_KEPT_NUMBER_LENGTH):
+            return text
+        return "x" * len(text)
+
+    def _anonymize_dict(self, obj: dict) -> dict:
+        staff = self._is_staff(obj)
+        user_or_chat = self._is_user_or_chat(obj)
+        result = {}
+        for key, value in obj.items():
+            if key in DROPPED_KEYS:
+                continue
+            if isinstance(value, dict):
+                result[key] = self._anonymize_dict(value)
+            elif isinstance(value, list):
+                result[key] = [self._anonymize_dict(item) if isinstance(item, dict) else item for item in value]
+            elif (key in ID_KEYS or (key == "id" and user_or_chat)) and isinstance(value, int) and not staff:
+                result[key] = self._anonymize_id(value)
+            elif key in FILE_ID_KEYS and isinstance(value, str):
+                result[key] = "file_" + self._pseudonym(value)[:16]
+            elif key == "first_name" and not staff:
+                result[key] = "anon"  # required by telebot.types.User
+            elif key == "username" and isinstance(value, str) and not staff:
+                result[key] = "user_" + self._pseudonym(value)[:8]
+            elif key in TEXT_KEYS and isinstance(value, str):
+                result[key] = self._anonymize_text(value)
+            else:
+                result[key] = value
+        return result
+
+
+class UpdateRecorder:
+    # Appends every incoming update and the time spent handling it to a JSON lines file:
+    # {"ts": <receive unix time>, "ms": <handling time>, "update": <anonymized raw update>}
+    __slots__ = [
+        "_path",
+        "_anonymizer",
+        "_raw_updates",
+        "_lock",
+        "_output",
+    ]
+
+    def __init__(self, path: str, is_staff_username: Callable[[str], bool], salt: Optional[bytes] = None):
+        self._path: str = path
+        self._anonymizer: UpdateAnonymizer = UpdateAnonymizer(salt or os.urandom(16), is_staff_username)
+        self._raw_updates: dict[int, tuple[float, dict]] = {}  # update_id -> (receive time, anonymized update)
+        self._lock: threading.Lock = threading.Lock()
+        self._output = open(path, "a", encoding="utf8")
+
+    def install(self, bot: telebot.TeleBot):
+        # Raw json is only available before telebot parses it, so it is captured in apihelper
+        get_updates = apihelper.get_updates
+        process_new_updates = bot.process_new_updates
+
+        def recording_get_updates(*args, **kwargs):
+            raw_updates = get_updates(*args, **kwargs)
+            received_at = time.time()
+            for raw_update in raw_updates or []:
+                self._raw_updates[raw_update["update_id"]] = (received_at, self._anonymizer.anonymize(raw_update))
+            return raw_updates
+
+        def recording_process_new_updates(updates: list[types.Update]):
+            for update in updates:
+                start = time.perf_counter()
+                try:
+                    process_new_updates([update])
+                finally:
+                    self._write(update.update_id, (time.perf_counter() - start) * 1000)
+
+        apihelper.get_updates = recording_get_updates
+        bot.process_new_updates = recording_process_new_updates
+
+    def _write(self, update_id: int, handling_ms: float):
+        if update_id not in self._raw_updates:
+            return
+        received_at, raw_update = self._raw_updates.pop(update_id)
+        line = json.dumps({"ts": round(received_at, 3), "ms": round(handling_ms, 3), "update": raw_update},
+                          ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._output.write(line + "\n")
+            self._output.flush()
+
+
+def read_trace(path: str) -> Iterator[dict]:
+    with open(path, encoding="utf8") as inp:
+        for line in inp:
+            if line.strip():
+                yield json.loads(line)